@@ -3,32 +3,100 @@ import os
 import sys
 import shutil
 import glob
+import argparse
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 import subprocess
 
-load_dotenv()
+IMPORTTIME_PREFIX = "import time:"
+READY_PREFIX = "startup:ready:"
+
+
+def parse_importtime(stderr):
+    modules = {}
+    ready_at = None
+    other = []
+    for line in (stderr or "").splitlines():
+        if line.startswith(READY_PREFIX):
+            try:
+                ready_at = float(line[len(READY_PREFIX):])
+            except ValueError:
+                pass
+            continue
+        if not line.startswith(IMPORTTIME_PREFIX):
+            other.append(line)
+            continue
+        parts = line[len(IMPORTTIME_PREFIX):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:]
+        if name.startswith(" "):
+            continue
+        root = name.split(".")[0]
+        modules[root] = modules.get(root, 0) + int(parts[1]) / 1000.0
+    return modules, ready_at, "\n".join(other)
+
 
 class SEMAnalysisPipeline:
-    def __init__(self):
+    def __init__(self, force_refresh: bool = False, profile_startup: bool = False):
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.output_folder = f"output"
+        self.config_file = "config.yaml"
+        self.output_root = "output"
+        self.output_folder = os.path.join(self.output_root, os.path.splitext(os.path.basename(self.config_file))[0])
         self.keywords_file = None
         self.gemini_api_key = os.getenv("GEMINI_API_KEY")
+        self.force_refresh = force_refresh
+        self.cache_stats = None
+        self.profile_startup = profile_startup
+        self.startup_profiles = []
+
+    def run_stage(self, name, script, env):
+        cmd = [sys.executable, script]
+        if self.profile_startup:
+            cmd = [sys.executable, "-X", "importtime", script]
+            env = dict(env, SEM_PROFILE_STARTUP="1")
+        launched_at = time.time()
+        start = time.monotonic()
+        result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+        stage_ms = (time.monotonic() - start) * 1000
+        if self.profile_startup:
+            modules, ready_at, result.stderr = parse_importtime(result.stderr)
+            ready_ms = (ready_at - launched_at) * 1000 if ready_at is not None else None
+            self.startup_profiles.append((name, ready_ms, stage_ms, modules))
+        return result
+
+    def startup_summary(self, top: int = 8):
+        lines = []
+        for name, ready_ms, stage_ms, modules in self.startup_profiles:
+            ranked = sorted(modules.items(), key=lambda kv: kv[1], reverse=True)[:top]
+            ready = f"{ready_ms:.1f}" if ready_ms is not None else "na"
+            lines.append(
+                f"startup:{name}:ready_ms={ready},stage_ms={stage_ms:.1f},imports_ms={sum(modules.values()):.1f},"
+                + "top=" + ",".join(f"{module}:{ms:.1f}" for module, ms in ranked)
+            )
+        return lines
 
     def create_output_folder(self):
-        if os.path.exists(self.output_folder):
-            shutil.rmtree(self.output_folder)
-        os.makedirs(self.output_folder)
+        os.makedirs(self.output_root, exist_ok=True)
+        reset_output_folder(self.output_root, self.output_folder)
 
     def run_web_scraping(self):
         try:
-            if not os.path.exists("config.yaml"):
+            if not os.path.exists(self.config_file):
                 print("error:config_missing")
                 return False
             env = os.environ.copy()
             env["SEM_OUTPUT_DIR"] = self.output_folder
-            result = subprocess.run([sys.executable, "wordstream_scraper.py"], capture_output=True, text=True, env=env)
+            if self.force_refresh:
+                env["SEM_FORCE_REFRESH"] = "1"
+            result = self.run_stage("scraper", "wordstream_scraper.py", env)
+            for line in (result.stdout or "").splitlines():
+                if line.startswith("cache:"):
+                    self.cache_stats = line.strip()
             if result.returncode != 0:
                 print("error:scraper_failed")
                 if result.stdout:
@@ -54,7 +122,7 @@ class SEMAnalysisPipeline:
             env = os.environ.copy()
             env["SEM_OUTPUT_DIR"] = self.output_folder
             env["SEM_KEYWORDS_FILE"] = self.keywords_file
-            result = subprocess.run([sys.executable, "sem_analysis.py"], capture_output=True, text=True, env=env)
+            result = self.run_stage("analysis", "sem_analysis.py", env)
             if result.returncode != 0:
                 print("error:analysis_failed")
                 if result.stdout:
@@ -84,11 +152,216 @@ class SEMAnalysisPipeline:
         return True
 
 
+def _env_number(name, default):
+    try:
+        return float(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+
+def reset_output_folder(output_root, folder):
+    root = os.path.realpath(output_root)
+    target = os.path.realpath(folder)
+    if os.path.dirname(target) != root:
+        raise ValueError(f"refusing to reset {folder}: not a direct child of {output_root}")
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.makedirs(target)
+
+
+def load_tenants(path):
+    import yaml
+    if os.path.isdir(path):
+        configs = sorted(glob.glob(os.path.join(path, "*.yaml")) + glob.glob(os.path.join(path, "*.yml")))
+        entries = [{'config': os.path.abspath(c)} for c in configs]
+        base_dir = path
+    else:
+        with open(path, 'r') as file:
+            manifest = yaml.safe_load(file) or {}
+        entries = manifest.get('tenants', []) if isinstance(manifest, dict) else manifest
+        base_dir = os.path.dirname(os.path.abspath(path))
+    tenants = []
+    seen = set()
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'config': entry}
+        config = entry['config']
+        if not os.path.isabs(config):
+            config = os.path.join(base_dir, config)
+        name = re.sub(r"[^\w.-]+", "_", str(entry.get('name') or os.path.splitext(os.path.basename(config))[0]))
+        if not name or name.startswith('.'):
+            raise ValueError(f"invalid tenant name: {name!r}")
+        if name in seen:
+            raise ValueError(f"duplicate tenant name: {name}")
+        seen.add(name)
+        tenants.append({'name': name, 'config': config})
+    return tenants
+
+
+class SEMBatchPipeline:
+    def __init__(self, batch_path: str, force_refresh: bool = False):
+        self.batch_path = batch_path
+        self.output_root = "output"
+        self.force_refresh = force_refresh
+        self.gemini_api_key = os.getenv("GEMINI_API_KEY")
+        self.scrape_workers = max(int(_env_number("SEM_SCRAPE_WORKERS", 2)), 1)
+        self.llm_workers = max(int(_env_number("SEM_LLM_WORKERS", 4)), 1)
+        self.llm_rpm = _env_number("SEM_LLM_RPM", 15)
+        self.results = []
+        self.lock = threading.Lock()
+        self.cache = None
+        self.driver_pool = None
+
+    def create_tenant_folder(self, tenant):
+        folder = os.path.join(self.output_root, tenant['name'])
+        reset_output_folder(self.output_root, folder)
+        return folder
+
+    def scrape_tenant(self, tenant):
+        from wordstream_scraper import WordStreamScraper
+        result = {'tenant': tenant['name'], 'status': 'ok', 'keywords': 0, 'llm_calls': 0,
+                  'scrape_seconds': 0.0, 'analysis_seconds': 0.0, 'cache_hits': 0, 'live_scrapes': 0}
+        start = time.monotonic()
+        try:
+            if not os.path.exists(tenant['config']):
+                result['status'] = "error:config_missing"
+                return result, None
+            folder = self.create_tenant_folder(tenant)
+            scraper = WordStreamScraper(tenant['config'], output_dir=folder,
+                                        cache=self.cache, driver_pool=self.driver_pool)
+            try:
+                keywords_file = scraper.run_scraping()
+            finally:
+                result['cache_hits'] = scraper.cache_hits
+                result['live_scrapes'] = scraper.live_scrapes
+            if not keywords_file:
+                result['status'] = "error:no_keywords"
+                return result, None
+            return result, keywords_file
+        except Exception as e:
+            result['status'] = f"error:scraper_exception:{e}"
+            return result, None
+        finally:
+            result['scrape_seconds'] = time.monotonic() - start
+
+    def analyze_tenant(self, tenant, result, keywords_file, model, rate_limiter):
+        from sem_analysis import SEMAnalysis
+        start = time.monotonic()
+        try:
+            analyzer = SEMAnalysis(keywords_file, config_file=tenant['config'], model=model,
+                                   rate_limiter=rate_limiter, output_dir=os.path.dirname(keywords_file))
+            result['keywords'] = len(analyzer.keywords_data)
+            try:
+                analyzer.run_analysis()
+            finally:
+                result['llm_calls'] = analyzer.llm_calls
+        except Exception as e:
+            result['status'] = f"error:analysis_exception:{e}"
+        finally:
+            result['analysis_seconds'] = time.monotonic() - start
+        with self.lock:
+            self.results.append(result)
+
+    def run_pipeline(self):
+        from sem_analysis import RateLimiter, create_gemini_model
+        from wordstream_scraper import ScrapeCache, DriverPool
+        tenants = load_tenants(self.batch_path)
+        if not tenants:
+            print("error:no_tenants")
+            return False
+        if not self.gemini_api_key or self.gemini_api_key == "your-gemini-api-key-here":
+            print("error:gemini_key_missing")
+            return False
+        model = create_gemini_model(self.gemini_api_key)
+        if model is None:
+            print("error:llm_unavailable")
+            return False
+        rate_limiter = RateLimiter(self.llm_rpm)
+        os.makedirs(self.output_root, exist_ok=True)
+        self.cache = ScrapeCache(force_refresh=self.force_refresh or None)
+        self.driver_pool = DriverPool()
+        self.started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.llm_workers) as llm_pool:
+            def on_scraped(tenant, future):
+                result, keywords_file = future.result()
+                if keywords_file:
+                    llm_pool.submit(self.analyze_tenant, tenant, result, keywords_file, model, rate_limiter)
+                else:
+                    with self.lock:
+                        self.results.append(result)
+            try:
+                with ThreadPoolExecutor(max_workers=self.scrape_workers) as scrape_pool:
+                    for tenant in tenants:
+                        future = scrape_pool.submit(self.scrape_tenant, tenant)
+                        future.add_done_callback(lambda f, t=tenant: on_scraped(t, f))
+            finally:
+                self.driver_pool.close()
+        self.elapsed = time.monotonic() - self.started
+        self.results.sort(key=lambda r: r['tenant'])
+        self.write_report()
+        return all(r['status'] == 'ok' for r in self.results)
+
+    def write_report(self):
+        import csv
+        report_file = os.path.join(self.output_root, "batch_report.csv")
+        with open(report_file, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Tenant', 'Status', 'Keywords', 'LLM Calls', 'Scrape Seconds', 'Analysis Seconds', 'Cache Hits', 'Live Scrapes'])
+            for r in self.results:
+                writer.writerow([r['tenant'], r['status'], r['keywords'], r['llm_calls'],
+                                 round(r['scrape_seconds'], 2), round(r['analysis_seconds'], 2),
+                                 r['cache_hits'], r['live_scrapes']])
+        self.report_file = report_file
+
+    def summary(self):
+        ok = [r for r in self.results if r['status'] == 'ok']
+        elapsed = max(self.elapsed, 1e-9)
+        keywords = sum(r['keywords'] for r in ok)
+        llm_calls = sum(r['llm_calls'] for r in self.results)
+        lines = [f"{r['tenant']}:{r['status']}" for r in self.results if r['status'] != 'ok']
+        lines.append(
+            f"batch:tenants={len(self.results)},ok={len(ok)},failed={len(self.results) - len(ok)},"
+            f"seconds={elapsed:.1f},tenants_per_min={len(ok) * 60 / elapsed:.2f},"
+            f"keywords={keywords},keywords_per_sec={keywords / elapsed:.2f},llm_calls={llm_calls}"
+        )
+        lines.append(self.cache.summary())
+        lines.append(self.report_file)
+        return lines
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the SEM scraping and analysis pipeline")
+    parser.add_argument("--force-refresh", action="store_true", help="ignore cached scrape results and re-scrape")
+    parser.add_argument("--batch", metavar="PATH", help="directory of tenant configs or a manifest yaml listing them")
+    parser.add_argument("--profile-startup", action="store_true", help="report per-stage import time breakdowns")
+    args = parser.parse_args(argv)
+    if args.batch and args.profile_startup:
+        parser.error("--profile-startup profiles stage subprocesses and is not supported with --batch")
+    return args
+
+
+def run_batch(args):
+    pipeline = SEMBatchPipeline(args.batch, force_refresh=args.force_refresh)
+    ok = pipeline.run_pipeline()
+    if pipeline.results:
+        for line in pipeline.summary():
+            print(line)
+    return 0 if ok else 1
+
+
 def main():
+    args = parse_args()
+    load_dotenv()
     try:
-        pipeline = SEMAnalysisPipeline()
+        if args.batch:
+            return run_batch(args)
+        pipeline = SEMAnalysisPipeline(force_refresh=args.force_refresh, profile_startup=args.profile_startup)
         ok = pipeline.run_pipeline()
+        for line in pipeline.startup_summary():
+            print(line)
         if ok:
+            if pipeline.cache_stats:
+                print(pipeline.cache_stats)
             print(pipeline.output_folder)
             return 0
         return 1
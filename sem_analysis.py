@@ -1,13 +1,47 @@
-import pandas as pd
-import yaml
-import numpy as np
 from datetime import datetime
 import csv
 import os
-from dotenv import load_dotenv
-load_dotenv()
+import sys
 import re
 import time
+import threading
+from collections import Counter, defaultdict
+from itertools import combinations
+from math import comb
+
+class RateLimiter:
+    def __init__(self, calls_per_minute: float = 0):
+        self.interval = 60.0 / calls_per_minute if calls_per_minute and calls_per_minute > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def create_gemini_model(gemini_api_key: str):
+    if not gemini_api_key:
+        return None
+    try:
+        import google.generativeai as genai
+        genai.configure(api_key=gemini_api_key)
+        return genai.GenerativeModel('gemini-1.5-flash')
+    except ImportError:
+        return None
+    except Exception:
+        try:
+            return genai.GenerativeModel('gemini-1.5-pro')
+        except:
+            try:
+                return genai.GenerativeModel('gemini-pro')
+            except:
+                return None
 
 def _extract_json_object(text: str):
     import json
@@ -26,37 +60,247 @@ def _extract_json_object(text: str):
         return json.loads(candidate)
     raise ValueError("No JSON object found in LLM response")
 
+class KeywordConflictIndex:
+    MAX_NAME_TOKENS = 3
+    NAME_SUFFIXES = ('india', 'usa', 'uk', 'uae', 'global')
+
+    def __init__(self, brand_name: str = None, competitor_name: str = None):
+        self.entries = []
+        self.token_counts = Counter()
+        self.by_text = defaultdict(list)
+        self.phrase_index = defaultdict(list)
+        self.broad_ids = []
+        self.broad_postings = None
+        self.brand_terms = self.name_terms(brand_name)
+        self.competitor_terms = self.name_terms(competitor_name) - self.brand_terms
+
+    @staticmethod
+    def tokenize(text):
+        return tuple(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+    @staticmethod
+    def normalize_match_type(match_type):
+        m = str(match_type or '').lower()
+        if 'exact' in m:
+            return 'exact'
+        if 'phrase' in m:
+            return 'phrase'
+        return 'broad'
+
+    @classmethod
+    def name_terms(cls, name):
+        joined = ''.join(cls.tokenize(name or ''))
+        if not joined or joined == 'unknown':
+            return set()
+        terms = {joined}
+        for suffix in cls.NAME_SUFFIXES:
+            if joined.endswith(suffix) and len(joined) - len(suffix) >= 4:
+                terms.add(joined[:-len(suffix)])
+        return terms
+
+    def _find_name(self, tokens, terms):
+        for n in range(1, self.MAX_NAME_TOKENS + 1):
+            for i in range(len(tokens) - n + 1):
+                if ''.join(tokens[i:i+n]) in terms:
+                    return ' '.join(tokens[i:i+n])
+        return None
+
+    @staticmethod
+    def _contains_phrase(tokens, phrase):
+        n = len(phrase)
+        return any(tokens[i:i+n] == phrase for i in range(len(tokens) - n + 1))
+
+    def add(self, ad_group, keyword, match_type=''):
+        tokens = self.tokenize(keyword)
+        if not tokens:
+            return
+        entry_id = len(self.entries)
+        entry = {
+            'ad_group': ad_group,
+            'keyword': keyword,
+            'tokens': tokens,
+            'token_set': frozenset(tokens),
+            'match_type': self.normalize_match_type(match_type)
+        }
+        self.entries.append(entry)
+        self.token_counts.update(entry['token_set'])
+        self.by_text[' '.join(tokens)].append(entry_id)
+        if entry['match_type'] == 'phrase':
+            self.phrase_index[tokens].append(entry_id)
+        elif entry['match_type'] == 'broad':
+            self.broad_ids.append(entry_id)
+        self.broad_postings = None
+
+    def _build_broad_postings(self):
+        postings = defaultdict(list)
+        by_set = defaultdict(list)
+        for i in self.broad_ids:
+            token_set = self.entries[i]['token_set']
+            anchor = min(token_set, key=lambda t: (self.token_counts[t], t))
+            postings[anchor].append(i)
+            by_set[token_set].append(i)
+        self.broad_postings = postings
+        self.broad_by_set = by_set
+        self.broad_sizes = sorted({len(token_set) for token_set in by_set})
+
+    def _capturing_entries(self, entry):
+        tokens = entry['tokens']
+        for n in range(1, len(tokens) + 1):
+            for i in range(len(tokens) - n + 1):
+                yield from self.phrase_index.get(tokens[i:i+n], ())
+        token_set = entry['token_set']
+        scan_cost = sum(len(self.broad_postings.get(token, ())) for token in token_set)
+        subset_cost = sum(comb(len(token_set), size) for size in self.broad_sizes if size <= len(token_set))
+        if subset_cost < scan_cost:
+            ordered = sorted(token_set)
+            for size in self.broad_sizes:
+                if size > len(ordered):
+                    break
+                for subset in combinations(ordered, size):
+                    yield from self.broad_by_set.get(frozenset(subset), ())
+        else:
+            for token in token_set:
+                for i in self.broad_postings.get(token, ()):
+                    if self.entries[i]['token_set'] <= token_set:
+                        yield i
+
+    def _duplicate_owner(self, ids, group_kind):
+        kind = self.classify(self.entries[ids[0]])[0]
+        rank = {'exact': 0, 'phrase': 1, 'broad': 2}
+        return min(ids, key=lambda i: (
+            group_kind.get(self.entries[i]['ad_group']) != kind,
+            rank[self.entries[i]['match_type']],
+            i
+        ))
+
+    def find_overlaps(self, group_kind=None):
+        if self.broad_postings is None:
+            self._build_broad_postings()
+        if group_kind is None:
+            group_kind = self.find_leaks()[1]
+        overlaps = []
+        for ids in self.by_text.values():
+            groups = {self.entries[i]['ad_group'] for i in ids}
+            if len(groups) < 2:
+                continue
+            owner = self._duplicate_owner(ids, group_kind)
+            removed = {self.entries[owner]['ad_group']}
+            for i in ids:
+                if self.entries[i]['ad_group'] not in removed:
+                    removed.add(self.entries[i]['ad_group'])
+                    overlaps.append(self._overlap('duplicate', 'remove', owner, i))
+        for j, entry in enumerate(self.entries):
+            for i in self._capturing_entries(entry):
+                other = self.entries[i]
+                if other['ad_group'] != entry['ad_group'] and other['tokens'] != entry['tokens']:
+                    overlaps.append(self._overlap(other['match_type'], 'add_negative', j, i))
+        return overlaps
+
+    def _overlap(self, kind, action, owner_id, captured_by_id):
+        owner = self.entries[owner_id]
+        other = self.entries[captured_by_id]
+        return {
+            'type': kind,
+            'action': action,
+            'ad_group': other['ad_group'],
+            'keyword': other['keyword'],
+            'conflicting_ad_group': owner['ad_group'],
+            'conflicting_keyword': owner['keyword']
+        }
+
+    def classify(self, entry):
+        term = self._find_name(entry['tokens'], self.competitor_terms)
+        if term:
+            return 'competitor', term
+        term = self._find_name(entry['tokens'], self.brand_terms)
+        if term:
+            return 'brand', term
+        return 'generic', None
+
+    def find_leaks(self):
+        group_entries = defaultdict(list)
+        for i, entry in enumerate(self.entries):
+            group_entries[entry['ad_group']].append((i, self.classify(entry)))
+        group_kind = {}
+        kind_counts = {}
+        name_terms = {'brand': set(), 'competitor': set()}
+        for group, items in group_entries.items():
+            counts = defaultdict(int)
+            for _, (kind, token) in items:
+                counts[kind] += 1
+                if token:
+                    name_terms[kind].add(token)
+            group_kind[group] = max(counts, key=lambda k: (counts[k], k == 'generic'))
+            kind_counts[group] = counts
+        home_groups = {}
+        for kind in name_terms:
+            candidates = [g for g, k in group_kind.items() if k == kind]
+            if candidates:
+                home_groups[kind] = max(candidates, key=lambda g: kind_counts[g][kind])
+        leaks = []
+        for group, items in group_entries.items():
+            for i, (kind, _) in items:
+                if kind != 'generic' and kind != group_kind[group]:
+                    leaks.append({
+                        'type': f"{kind}_leak",
+                        'action': 'move',
+                        'ad_group': group,
+                        'keyword': self.entries[i]['keyword'],
+                        'conflicting_ad_group': home_groups.get(kind, ''),
+                        'conflicting_keyword': ''
+                    })
+        return leaks, group_kind, name_terms, home_groups
+
+    def build(self):
+        leaks, group_kind, name_terms, home_groups = self.find_leaks()
+        overlaps = self.find_overlaps(group_kind)
+        own_texts = defaultdict(set)
+        for entry in self.entries:
+            own_texts[entry['ad_group']].add(entry['tokens'])
+        negatives = defaultdict(dict)
+        for o in overlaps:
+            if o['action'] == 'add_negative' and self.tokenize(o['conflicting_keyword']) not in own_texts[o['ad_group']]:
+                negatives[o['ad_group']].setdefault((o['conflicting_keyword'], 'Exact'), o['type'])
+        for group, kind in group_kind.items():
+            for other_kind, terms in name_terms.items():
+                if other_kind == kind or other_kind not in home_groups:
+                    continue
+                for term in terms:
+                    phrase = tuple(term.split())
+                    if not any(self._contains_phrase(tokens, phrase) for tokens in own_texts[group]):
+                        negatives[group].setdefault((term, 'Phrase'), f"{other_kind}_term")
+        return {
+            'overlaps': overlaps,
+            'leaks': leaks,
+            'negatives': {
+                group: sorted((keyword, match_type, reason) for (keyword, match_type), reason in items.items())
+                for group, items in sorted(negatives.items())
+            }
+        }
+
 class SEMAnalysis:
-    def __init__(self, keywords_file: str, config_file: str = "config.yaml", gemini_api_key: str = None):
+    def __init__(self, keywords_file: str, config_file: str = "config.yaml", gemini_api_key: str = None,
+                 model=None, rate_limiter: RateLimiter = None, output_dir: str = None):
         self.keywords_data = self.load_keywords(keywords_file)
         self.config = self.load_config(config_file)
         self.analysis_results = {}
-        if gemini_api_key:
-            try:
-                import google.generativeai as genai
-                genai.configure(api_key=gemini_api_key)
-                self.model = genai.GenerativeModel('gemini-1.5-flash')
-                self.use_llm = True
-            except ImportError:
-                self.use_llm = False
-            except Exception:
-                try:
-                    self.model = genai.GenerativeModel('gemini-1.5-pro')
-                    self.use_llm = True
-                except:
-                    try:
-                        self.model = genai.GenerativeModel('gemini-pro')
-                        self.use_llm = True
-                    except:
-                        self.use_llm = False
-        else:
-            self.use_llm = False
+        self.model = model if model is not None else create_gemini_model(gemini_api_key)
+        self.use_llm = self.model is not None
+        self.rate_limiter = rate_limiter
+        self.output_dir = output_dir or os.getenv("SEM_OUTPUT_DIR")
+        self.llm_calls = 0
+
+    def _generate(self, prompt: str):
+        if self.rate_limiter:
+            self.rate_limiter.wait()
+        self.llm_calls += 1
+        return self.model.generate_content(prompt)
 
     def _call_llm_json(self, prompt: str, retries: int = 2):
         last_err = None
         for attempt in range(retries + 1):
             try:
-                response = self.model.generate_content(prompt)
+                response = self._generate(prompt)
                 return _extract_json_object(response.text)
             except Exception as e:
                 last_err = e
@@ -70,7 +314,7 @@ class SEMAnalysis:
         last_err = None
         for attempt in range(retries + 1):
             try:
-                response = self.model.generate_content(prompt)
+                response = self._generate(prompt)
                 text = response.text or ""
                 arr = re.search(r"```json\s*(\[[\s\S]*?\])\s*```", text, re.IGNORECASE)
                 if arr:
@@ -95,6 +339,7 @@ class SEMAnalysis:
             yield items[i:i+size]
 
     def load_keywords(self, keywords_file: str):
+        import pandas as pd
         try:
             df = pd.read_csv(keywords_file)
             return df
@@ -102,6 +347,7 @@ class SEMAnalysis:
             raise FileNotFoundError(f"Keywords file {keywords_file} not found")
 
     def load_config(self, config_file: str):
+        import yaml
         try:
             with open(config_file, 'r') as file:
                 return yaml.safe_load(file)
@@ -144,19 +390,16 @@ Return STRICT JSON only with keys:
 """
         return self._call_llm_json(prompt)
 
-    def create_ad_groups_with_llm(self):
-        from collections import defaultdict
-        ad_groups = defaultdict(list)
-        rows = []
-        for idx, row in self.keywords_data.iterrows():
-            rows.append({
-                'id': int(idx),
-                'keyword': row['keyword'],
-                'search_volume': int(row['search_volume']),
-                'competition': str(row['competition'])
-            })
+    def classify_keywords_with_llm(self):
+        import pandas as pd
+        df = self.keywords_data
+        rows = [
+            {'id': int(idx), 'keyword': keyword, 'search_volume': int(volume), 'competition': str(competition)}
+            for idx, keyword, volume, competition in zip(df.index, df['keyword'], df['search_volume'], df['competition'])
+        ]
         brand_name = self.extract_brand_name(self.config.get('brand_website', ''))
         competitor_name = self.extract_brand_name(self.config.get('competitor_website', ''))
+        ids, ad_groups, intents, match_types, reasonings = [], [], [], [], []
         for chunk in self._batch(rows, 15):
             prompt = f"""
 You are an SEM expert. Classify each keyword record for campaign structuring.
@@ -170,17 +413,21 @@ Return ONLY a JSON array of objects:
 ]
 """
             results = self._call_llm_json_array(prompt)
-            result_by_id = {int(item.get('id')): item for item in results if isinstance(item, dict) and 'id' in item}
-            for item_id, item in result_by_id.items():
-                df_row = self.keywords_data.loc[item_id]
-                row_copy = df_row.copy()
-                row_copy['llm_ad_group'] = item.get('ad_group')
-                row_copy['llm_intent'] = item.get('intent')
-                row_copy['llm_match_type'] = item.get('match_type')
-                row_copy['llm_reasoning'] = item.get('reasoning')
-                group = row_copy['llm_ad_group'] or 'Uncategorized'
-                ad_groups[group].append(row_copy)
-        return dict(ad_groups)
+            for item in results:
+                if isinstance(item, dict) and 'id' in item:
+                    ids.append(int(item.get('id')))
+                    ad_groups.append(item.get('ad_group') or 'Uncategorized')
+                    intents.append(item.get('intent') or '')
+                    match_types.append(item.get('match_type') or '')
+                    reasonings.append(item.get('reasoning') or '')
+        llm_results = pd.DataFrame({
+            'llm_ad_group': ad_groups,
+            'llm_intent': intents,
+            'llm_match_type': match_types,
+            'llm_reasoning': reasonings
+        }, index=pd.Index(ids, dtype='int64'))
+        llm_results = llm_results[~llm_results.index.duplicated(keep='last')]
+        return df.join(llm_results, how='inner')
 
     def suggest_match_types(self, keyword):
         keyword_text = keyword['keyword']
@@ -211,35 +458,22 @@ Return ONLY a JSON array of objects:
         return min(target_cpc, cap_cpc)
 
     def create_search_campaign_keywords(self):
-        ad_groups = self.create_ad_groups_with_llm()
+        classified = self.classify_keywords_with_llm()
         target_cpc = self.calculate_target_cpc()
-        search_campaign = {}
-        for group_name, keywords in ad_groups.items():
-            if not keywords:
-                continue
-            group_data = []
-            for keyword in keywords:
-                match_type = keyword.get('llm_match_type') if isinstance(keyword, dict) else ''
-                avg_bid = (keyword['top_of_page_bid_low'] + keyword['top_of_page_bid_high']) / 2
-                if keyword['competition'] == 'High':
-                    suggested_cpc = min(avg_bid * 1.2, target_cpc * 1.5)
-                elif keyword['competition'] == 'Medium':
-                    suggested_cpc = min(avg_bid * 1.0, target_cpc)
-                else:
-                    suggested_cpc = min(avg_bid * 0.8, target_cpc * 0.8)
-                group_data.append({
-                    'keyword': keyword['keyword'],
-                    'search_volume': keyword['search_volume'],
-                    'match_type': match_type,
-                    'suggested_cpc': round(suggested_cpc, 2),
-                    'competition': keyword['competition'],
-                    'source': keyword['source'],
-                    'ad_group': keyword.get('llm_ad_group', group_name),
-                    'intent': keyword.get('llm_intent', ''),
-                    'reasoning': keyword.get('llm_reasoning', '')
-                })
-            search_campaign[group_name] = group_data
-        return search_campaign
+        avg_bid = (classified['top_of_page_bid_low'] + classified['top_of_page_bid_high']) / 2
+        competition = classified['competition']
+        suggested_cpc = (avg_bid * 0.8).clip(upper=target_cpc * 0.8)
+        suggested_cpc = suggested_cpc.where(competition != 'Medium', avg_bid.clip(upper=target_cpc))
+        suggested_cpc = suggested_cpc.where(competition != 'High', (avg_bid * 1.2).clip(upper=target_cpc * 1.5))
+        campaign = classified[['keyword', 'search_volume', 'competition', 'source']].assign(
+            match_type=classified['llm_match_type'],
+            suggested_cpc=suggested_cpc.round(2),
+            ad_group=classified['llm_ad_group'],
+            intent=classified['llm_intent'],
+            reasoning=classified['llm_reasoning']
+        )
+        group_order = campaign.groupby('ad_group', sort=False).ngroup()
+        return campaign.iloc[group_order.argsort(kind='stable')]
 
     def create_pmax_themes(self):
         brand_website = self.config.get('brand_website', '')
@@ -278,6 +512,10 @@ Return JSON:
             return "Unknown"
         url = url.replace('https://', '').replace('http://', '').replace('www.', '')
         domain = url.split('/')[0]
+        labels = domain.split('.')
+        while len(labels) > 2 and labels[0] in ('shop', 'store', 'm'):
+            labels = labels[1:]
+        domain = '.'.join(labels)
         if '.' in domain:
             brand = domain.split('.')[0]
             return brand.title()
@@ -317,9 +555,20 @@ Return JSON:
         shopping_bids.sort(key=lambda x: x['suggested_cpc'], reverse=True)
         return shopping_bids
 
+    def detect_keyword_conflicts(self, search_campaign):
+        index = KeywordConflictIndex(
+            self.extract_brand_name(self.config.get('brand_website', '')),
+            self.extract_brand_name(self.config.get('competitor_website', ''))
+        )
+        for ad_group, keyword, match_type in zip(
+            search_campaign['ad_group'], search_campaign['keyword'], search_campaign['match_type']
+        ):
+            index.add(ad_group, keyword, match_type)
+        return index.build()
+
     def export_results(self):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_dir = os.getenv("SEM_OUTPUT_DIR")
+        output_dir = self.output_dir
         if output_dir:
             os.makedirs(output_dir, exist_ok=True)
             def out(path):
@@ -330,22 +579,26 @@ Return JSON:
                 return path
         search_campaign = self.create_search_campaign_keywords()
         search_filename = out(f"search_{timestamp}.csv")
-        with open(search_filename, 'w', newline='') as file:
+        search_campaign.to_csv(
+            search_filename,
+            index=False,
+            columns=['ad_group', 'keyword', 'search_volume', 'match_type', 'suggested_cpc', 'competition', 'source', 'intent', 'reasoning'],
+            header=['Ad Group', 'Keyword', 'Search Volume', 'Match Type', 'Suggested CPC', 'Competition', 'Source', 'Intent', 'Reasoning']
+        )
+        conflicts = self.detect_keyword_conflicts(search_campaign)
+        negatives_filename = out(f"neg_{timestamp}.csv")
+        with open(negatives_filename, 'w', newline='') as file:
             writer = csv.writer(file)
-            writer.writerow(['Ad Group', 'Keyword', 'Search Volume', 'Match Type', 'Suggested CPC', 'Competition', 'Source', 'Intent', 'Reasoning'])
-            for ad_group, keywords in search_campaign.items():
-                for keyword in keywords:
-                    writer.writerow([
-                        ad_group,
-                        keyword['keyword'],
-                        keyword['search_volume'],
-                        keyword['match_type'],
-                        keyword['suggested_cpc'],
-                        keyword['competition'],
-                        keyword['source'],
-                        keyword.get('intent',''),
-                        keyword.get('reasoning','')
-                    ])
+            writer.writerow(['Ad Group', 'Negative Keyword', 'Match Type', 'Reason'])
+            for ad_group, negatives in conflicts['negatives'].items():
+                for keyword, match_type, reason in negatives:
+                    writer.writerow([ad_group, keyword, match_type, reason])
+        conflicts_filename = out(f"conflicts_{timestamp}.csv")
+        with open(conflicts_filename, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Type', 'Action', 'Ad Group', 'Keyword', 'Conflicting Ad Group', 'Conflicting Keyword'])
+            for row in conflicts['overlaps'] + conflicts['leaks']:
+                writer.writerow([row['type'], row['action'], row['ad_group'], row['keyword'], row['conflicting_ad_group'], row['conflicting_keyword']])
         pmax_themes = self.create_pmax_themes()
         pmax_filename = out(f"pmax_{timestamp}.csv")
         with open(pmax_filename, 'w', newline='') as file:
@@ -370,6 +623,8 @@ Return JSON:
                 ])
         return {
             'search_campaign': search_filename,
+            'negative_keywords': negatives_filename,
+            'keyword_conflicts': conflicts_filename,
             'pmax_themes': pmax_filename,
             'shopping_bids': shopping_filename
         }
@@ -379,7 +634,13 @@ Return JSON:
         results = self.export_results()
         return results
 
+def mark_ready():
+    if os.getenv("SEM_PROFILE_STARTUP"):
+        print(f"startup:ready:{time.time():.6f}", file=sys.stderr, flush=True)
+
 def main():
+    from dotenv import load_dotenv
+    load_dotenv()
     try:
         explicit_keywords = os.getenv("SEM_KEYWORDS_FILE")
         if explicit_keywords and os.path.exists(explicit_keywords):
@@ -395,6 +656,7 @@ def main():
         if not gemini_api_key or gemini_api_key == "your-gemini-api-key-here":
             raise RuntimeError("GEMINI_API_KEY not set. LLM is required.")
         analyzer = SEMAnalysis(latest_keywords_file, gemini_api_key=gemini_api_key)
+        mark_ready()
         analyzer.run_analysis()
     except Exception as e:
         print(f"Error: {e}")
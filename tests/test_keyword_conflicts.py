@@ -0,0 +1,89 @@
+import random
+import time
+
+from sem_analysis import KeywordConflictIndex
+
+
+def build(rows, brand='Timexindia', competitor='Titan'):
+    index = KeywordConflictIndex(brand, competitor)
+    for ad_group, keyword, match_type in rows:
+        index.add(ad_group, keyword, match_type)
+    return index.build()
+
+
+def test_phrase_and_broad_keywords_capture_other_groups():
+    result = build([
+        ('Generic', 'watch', 'Phrase'),
+        ('Men', 'men watch', 'Exact'),
+        ('Sport', 'running', 'Broad'),
+        ('Running', 'watch for running', 'Exact'),
+    ])
+    pairs = {(o['type'], o['ad_group'], o['conflicting_keyword']) for o in result['overlaps']}
+    assert ('phrase', 'Generic', 'men watch') in pairs
+    assert ('phrase', 'Generic', 'watch for running') in pairs
+    assert ('broad', 'Sport', 'watch for running') in pairs
+    assert ('men watch', 'Exact', 'phrase') in result['negatives']['Generic']
+
+
+def test_exact_keywords_capture_nothing():
+    result = build([('A', 'watch', 'Exact'), ('B', 'men watch', 'Exact')])
+    assert result['overlaps'] == []
+
+
+def test_generic_words_in_brand_name_are_not_brand_terms():
+    index = KeywordConflictIndex('Watchshop', 'Fossil')
+    index.add('Generic', 'smart watch', 'Exact')
+    index.add('Competitor', 'fossil watch', 'Exact')
+    result = index.build()
+    assert index.classify(index.entries[0]) == ('generic', None)
+    assert all(term != 'watch' for term, _, _ in result['negatives'].get('Competitor', []))
+
+
+def test_brand_name_matches_joined_tokens_and_regional_stem():
+    index = KeywordConflictIndex('Timexindia', None)
+    index.add('Brand', 'timex india watches', 'Exact')
+    index.add('Brand', 'timex watch', 'Exact')
+    assert [index.classify(e)[0] for e in index.entries] == ['brand', 'brand']
+
+
+def test_negatives_never_block_own_keywords():
+    result = build([('Watches', 'watches', 'Phrase'), ('Watches', 'timex watches', 'Exact')])
+    assert result['negatives'] == {}
+    assert [leak['type'] for leak in result['leaks']] == ['brand_leak']
+
+
+def _build_seconds(n, length):
+    rng = random.Random(n)
+    words = [f"w{i}" for i in range(500)]
+    index = KeywordConflictIndex(None, None)
+    for i in range(n):
+        index.add(f"g{i % 200}", ' '.join(rng.sample(words, length)), 'Broad')
+    start = time.perf_counter()
+    index.build()
+    return time.perf_counter() - start
+
+
+def test_overlap_detection_scales_near_linearly():
+    for length in (10, 11):
+        small = min(_build_seconds(2500, length) for _ in range(2))
+        large = min(_build_seconds(10000, length) for _ in range(2))
+        # 4x the keywords: linear is ~4x, quadratic would be ~16x
+        assert large < small * 8, (length, small, large)
+
+
+def test_duplicate_goes_to_group_of_matching_kind():
+    result = build([
+        ('Generic', 'timex watch', 'Exact'),
+        ('Generic', 'smart watch', 'Exact'),
+        ('Brand', 'timex watch', 'Broad'),
+        ('Brand', 'timex', 'Exact'),
+    ])
+    duplicates = [o for o in result['overlaps'] if o['type'] == 'duplicate']
+    assert [(o['action'], o['ad_group'], o['conflicting_ad_group']) for o in duplicates] == [('remove', 'Generic', 'Brand')]
+    assert ('timex watch', 'Exact', 'duplicate') not in result['negatives'].get('Generic', [])
+
+
+def test_duplicate_between_same_kind_groups_prefers_tighter_match_type():
+    result = build([('A', 'men watch', 'Broad'), ('B', 'men watch', 'Exact')])
+    duplicates = [o for o in result['overlaps'] if o['type'] == 'duplicate']
+    assert [(o['ad_group'], o['conflicting_ad_group']) for o in duplicates] == [('A', 'B')]
@@ -1,26 +1,168 @@
-
-import pandas as pd
 import time
-import yaml
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from selenium.webdriver.common.keys import Keys
 from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import csv
+import hashlib
+import json
 import os
+import sys
 import subprocess
+import tempfile
+import threading
+
+TRACKING_PARAM_PREFIXES = ("utm_", "gad_", "nb_")
+TRACKING_PARAMS = {"gclid", "gbraid", "wbraid", "fbclid", "msclkid", "nbt"}
+
+
+def normalize_url(url: str):
+    url = url.strip()
+    if "://" not in url:
+        url = "//" + url.lstrip("/")
+    parts = urlsplit(url)
+    netloc = parts.netloc.lower()
+    if netloc.startswith("www."):
+        netloc = netloc[4:]
+    query = []
+    for key, value in parse_qsl(parts.query, keep_blank_values=True):
+        k = key.lower()
+        if k in TRACKING_PARAMS or k.startswith(TRACKING_PARAM_PREFIXES) or value == "":
+            continue
+        query.append((key, value))
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower() or "https", netloc, path, urlencode(sorted(query)), ""))
+
+
+class ScrapeCache:
+    def __init__(self, cache_dir: str = None, max_age_hours: float = None, force_refresh: bool = None):
+        self.cache_dir = cache_dir or os.getenv("SEM_CACHE_DIR", ".sem_cache")
+        if max_age_hours is None:
+            try:
+                max_age_hours = float(os.getenv("SEM_CACHE_MAX_AGE_HOURS", "24"))
+            except Exception:
+                max_age_hours = 24.0
+        self.max_age_seconds = max_age_hours * 3600
+        if force_refresh is None:
+            force_refresh = os.getenv("SEM_FORCE_REFRESH", "").lower() in ("1", "true", "yes")
+        self.force_refresh = force_refresh
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'refreshed': 0, 'stored': 0, 'write_errors': 0}
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.refreshed_keys = set()
+
+    def count(self, stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def key_lock(self, website_url: str, country: str):
+        key = self.key(website_url, country)
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def key(self, website_url: str, country: str):
+        raw = f"{normalize_url(website_url)}|{country.strip().upper()}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def path(self, website_url: str, country: str):
+        return os.path.join(self.cache_dir, f"{self.key(website_url, country)}.json")
+
+    def get(self, website_url: str, country: str):
+        if self.force_refresh and self.key(website_url, country) not in self.refreshed_keys:
+            self.count('refreshed')
+            return None
+        path = self.path(website_url, country)
+        try:
+            with open(path, 'r') as file:
+                entry = json.load(file)
+            fetched_at = float(entry.get('fetched_at', 0))
+            keywords = [dict(kw) for kw in entry.get('keywords', [])]
+        except Exception:
+            self.count('misses')
+            return None
+        if self.max_age_seconds >= 0 and time.time() - fetched_at > self.max_age_seconds:
+            self.count('stale')
+            return None
+        self.count('hits')
+        return keywords
+
+    def put(self, website_url: str, country: str, keywords_data):
+        if not keywords_data:
+            return
+        path = self.path(website_url, country)
+        entry = {
+            'url': normalize_url(website_url),
+            'country': country,
+            'fetched_at': time.time(),
+            'keywords': keywords_data
+        }
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=self.cache_dir, suffix='.tmp', delete=False) as file:
+                tmp_path = file.name
+                json.dump(entry, file)
+            os.replace(tmp_path, path)
+            with self.lock:
+                self.refreshed_keys.add(self.key(website_url, country))
+            self.count('stored')
+        except (OSError, TypeError, ValueError):
+            self.count('write_errors')
+            if tmp_path and os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def summary(self):
+        return "cache:" + ",".join(f"{k}={v}" for k, v in self.stats.items())
+
+
+class DriverPool:
+    def __init__(self):
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self, factory):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return factory()
+
+    def release(self, driver):
+        try:
+            driver.delete_all_cookies()
+        except Exception:
+            self.discard(driver)
+            return
+        with self.lock:
+            self.idle.append(driver)
+
+    def discard(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.lock:
+            drivers, self.idle = self.idle, []
+        for driver in drivers:
+            self.discard(driver)
+
 
 class WordStreamScraper:
-    def __init__(self, config_file: str = "config.yaml"):
+    def __init__(self, config_file: str = "config.yaml", output_dir: str = None, cache: ScrapeCache = None,
+                 driver_pool: DriverPool = None):
         self.config = self.load_config(config_file)
         self.base_url = "https://www.wordstream.com/keywords?camplink=homepage&campname=FKT&cid=Web_Any_Products_FreeKeyword_Tool_KWT"
         self.results = []
+        self.cache = cache or ScrapeCache()
+        self.driver_pool = driver_pool
+        self.output_dir = output_dir or os.getenv("SEM_OUTPUT_DIR")
+        self.cache_hits = 0
+        self.live_scrapes = 0
 
     def load_config(self, config_file: str):
+        import yaml
         with open(config_file, 'r') as file:
             return yaml.safe_load(file)
 
@@ -38,6 +180,9 @@ class WordStreamScraper:
         return None
 
     def setup_driver(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
         chrome_options = Options()
         chrome_options.add_argument("--no-sandbox")
         chrome_options.add_argument("--disable-dev-shm-usage")
@@ -55,9 +200,27 @@ class WordStreamScraper:
     def scrape_keywords(self, website_url: str, country: str = None):
         if country is None:
             country = self.config['service_locations'][0] if self.config['service_locations'] else "United States"
-        driver = self.setup_driver()
+        with self.cache.key_lock(website_url, country):
+            cached = self.cache.get(website_url, country)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached
+            self.live_scrapes += 1
+            keywords_data = self.scrape_keywords_live(website_url, country)
+            self.cache.put(website_url, country, keywords_data)
+            return keywords_data
+
+    def scrape_keywords_live(self, website_url: str, country: str):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.common.keys import Keys
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.common.exceptions import TimeoutException, NoSuchElementException
+        pool = self.driver_pool
+        driver = pool.acquire(self.setup_driver) if pool else self.setup_driver()
         if not driver:
             return []
+        reusable = True
         try:
             driver.get(self.base_url)
             wait = WebDriverWait(driver, 10)
@@ -138,11 +301,16 @@ class WordStreamScraper:
             except TimeoutException:
                 return []
         except Exception:
+            reusable = False
             return []
         finally:
-            driver.quit()
+            if pool and reusable:
+                pool.release(driver)
+            else:
+                driver.quit()
 
     def extract_table_data(self, driver):
+        from selenium.webdriver.common.by import By
         keywords_data = []
         try:
             table = driver.find_element(By.TAG_NAME, "table")
@@ -206,41 +374,62 @@ class WordStreamScraper:
         if not filename:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"kw_{timestamp}.csv"
-        output_dir = os.getenv("SEM_OUTPUT_DIR")
+        output_dir = self.output_dir
         if output_dir:
             os.makedirs(output_dir, exist_ok=True)
             filename = os.path.join(output_dir, os.path.basename(filename))
         if keywords_data:
-            df = pd.DataFrame(keywords_data)
             try:
                 top_n = int(os.getenv("SEM_TOP_N", "10"))
             except Exception:
                 top_n = 10
-            if 'source' in df.columns and 'search_volume' in df.columns:
-                df = (
-                    df.sort_values(['source', 'search_volume'], ascending=[True, False])
-                      .groupby('source', group_keys=False)
-                      .head(top_n)
-                )
+            columns = list(dict.fromkeys(k for kw in keywords_data for k in kw))
+            if all('source' in kw and 'search_volume' in kw for kw in keywords_data):
+                ranked = sorted(keywords_data, key=lambda kw: -kw['search_volume'])
+                ranked.sort(key=lambda kw: kw['source'])
+                per_source = {}
+                rows = []
+                for kw in ranked:
+                    per_source[kw['source']] = per_source.get(kw['source'], 0) + 1
+                    if per_source[kw['source']] <= top_n:
+                        rows.append(kw)
             else:
-                df = df.head(top_n)
-            df.to_csv(filename, index=False)
+                rows = keywords_data[:max(top_n, 0)]
+            with open(filename, 'w', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=columns, lineterminator='\n')
+                writer.writeheader()
+                writer.writerows(rows)
             return filename
         return None
 
     def run_scraping(self):
-        keywords_data = self.scrape_both_websites()
+        own_pool = self.driver_pool is None
+        if own_pool:
+            self.driver_pool = DriverPool()
+        try:
+            keywords_data = self.scrape_both_websites()
+        finally:
+            if own_pool:
+                self.driver_pool.close()
+                self.driver_pool = None
         if keywords_data:
             return self.save_to_csv(keywords_data)
         return None
 
 
+def mark_ready():
+    if os.getenv("SEM_PROFILE_STARTUP"):
+        print(f"startup:ready:{time.time():.6f}", file=sys.stderr, flush=True)
+
+
 def main():
     try:
         scraper = WordStreamScraper()
+        mark_ready()
         result_file = scraper.run_scraping()
         if not result_file:
             return 1
+        print(scraper.cache.summary())
     except Exception:
         return 1
     return 0